@@ -1,12 +1,12 @@
 import bleak
 import asyncio
-import math
 import argparse
 import RPi.GPIO as gpio
 import atexit
 import abc
 import inspect
 import logging
+import mmap
 import time
 import sys
 from gpioasm import gpioasm
@@ -14,24 +14,67 @@ from gpioasm import gpioasm
 logging.basicConfig(level=logging.INFO)
 # logging.StreamHandler.terminator = ''
 
+# BCM283x GPIO block as mapped by /dev/gpiomem, as 32 bit word offsets.
+# only valid on the SoCs listed here, the BCM2712 (Pi 5) has a different layout
+GPIOMEM_PATH = '/dev/gpiomem'
+GPIOMEM_SOCS = (b'brcm,bcm2835', b'brcm,bcm2836', b'brcm,bcm2837', b'brcm,bcm2711')
+DEVICE_TREE_COMPATIBLE_PATH = '/proc/device-tree/compatible'
+GPIO_SET0 = 0x1c // 4
+GPIO_CLR0 = 0x28 // 4
+GPIO_LEV0 = 0x34 // 4
+
+DIGITAL_INPUT_UUID = '00002a56-0000-1000-8000-00805f9b34fb'
+DIGITAL_OUTPUT_UUID = '00002a57-0000-1000-8000-00805f9b34fb'
+GPIOASM_UUID = 'b1190001-2a74-d5a2-784f-c1cdb3862ab0'
+
+# defaults the kernel applies to new LE connections of the default adapter, in units of 1.25ms
+CONN_INTERVAL_PATH = '/sys/kernel/debug/bluetooth/hci0/conn_{bound}_interval'
+
+COLORS = {
+    'grey': "\x1b[38;20m",
+    'yellow': "\x1b[33;20m",
+    'red': "\x1b[31;20m",
+    'green': "\x1b[32;20m",
+    'bold_red': "\x1b[31;1m",
+    'reset': "\x1b[0m",
+}
+
+SIGNALS_LIST = (
+    (0,0,0,0),
+    (1,0,0,0),
+    (0,1,0,0),
+    (0,0,1,0),
+    (0,0,0,1),
+    (1,1,0,0),
+    (0,0,1,1),
+    (1,0,1,0),
+    (0,1,0,1),
+    (1,1,1,1),
+    (0,0,0,0),
+)
+
+# input states traced while test.gpioasm runs, with the delay in ms each should take
+GPIOASM_TARGETS = (
+    ((1, 0, 0, 0), 100),
+    ((0, 1, 0, 0), 100),
+    ((0, 0, 1, 0), 100),
+    ((0, 0, 0, 1), 100),
+) + tuple(
+    target
+    for timeout in (100, 200)
+    for _ in range(10)
+    for target in (((1, 0, 1, 0), timeout), ((0, 1, 0, 1), timeout))
+)
+
 
 def print_color(color='reset'):
     if color is None:
-        print("\x1b[0m")
+        sys.stdout.write(COLORS['reset'] + '\n')
         return
-    print({
-        'grey': "\x1b[38;20m",
-        'yellow': "\x1b[33;20m",
-        'red': "\x1b[31;20m",
-        'green': "\x1b[32;20m",
-        'bold_red': "\x1b[31;1m",
-        'reset': "\x1b[0m",
-    }[color], end='')
+    sys.stdout.write(COLORS[color])
 
 def print_color_str(str, color='green'):
-    print_color(color)
-    print(str)
-    print_color('reset')
+    sys.stdout.write(COLORS[color] + str + '\n' + COLORS['reset'])
 
 class IOLayer(abc.ABC):
     def __init__(self, name):
@@ -54,36 +97,120 @@ class IOLayer(abc.ABC):
 class RPIGPIOLayer(IOLayer):
     def __init__(self, input_pins, output_pins):
         super().__init__('GPIO')
-        self.input_pins = input_pins
-        self.output_pins = output_pins
+        self.input_pins = tuple(input_pins)
+        self.output_pins = tuple(output_pins)
+        if max(self.input_pins + self.output_pins) > 31:
+            raise ValueError('only BCM pins 0-31 are supported')
+        self.output_masks = tuple(1 << pin for pin in self.output_pins)
+        self.input_mask = self.inputs_to_mask((1,) * len(self.input_pins))
+        self.gpiomem = None
+        self.registers = None
+        self.logger = logging.getLogger('GPIO')
 
     async def init(self):
+        # RPi.GPIO configures the pin directions. Where the SoC is known, levels are
+        # read and written through the register block so all pins take one access,
+        # otherwise every access goes through RPi.GPIO
         gpio.setmode(gpio.BCM)
         for input_pin in self.input_pins:
             gpio.setup(input_pin, gpio.IN)
         for output_pin in self.output_pins:
             gpio.setup(output_pin, gpio.OUT)
+        self.map_registers()
+
+    def map_registers(self):
+        try:
+            with open(DEVICE_TREE_COMPATIBLE_PATH, 'rb') as file:
+                compatible = file.read().split(b'\0')
+            if not any(soc in compatible for soc in GPIOMEM_SOCS):
+                self.logger.info('unknown GPIO register layout, using RPi.GPIO for all accesses')
+                return
+            with open(GPIOMEM_PATH, 'r+b') as gpiomem:
+                self.gpiomem = mmap.mmap(gpiomem.fileno(), mmap.PAGESIZE)
+        except OSError as e:
+            self.logger.info('GPIO registers not accessible, using RPi.GPIO for all accesses: %s', e)
+            return
+        self.registers = memoryview(self.gpiomem).cast('I')
 
     def uninit(self):
+        if self.registers is not None:
+            self.registers.release()
+            self.registers = None
+        if self.gpiomem is not None:
+            self.gpiomem.close()
+            self.gpiomem = None
         return gpio.cleanup()
 
     def set_outputs(self, outputs):
-        gpio.output(self.output_pins[:len(outputs)], list(map(bool, outputs))) 
+        if self.registers is None:
+            gpio.output(self.output_pins[:len(outputs)], [bool(output) for output in outputs])
+            return
+        set_mask = clear_mask = 0
+        for mask, output in zip(self.output_masks, outputs):
+            if output:
+                set_mask |= mask
+            else:
+                clear_mask |= mask
+        self.registers[GPIO_SET0] = set_mask
+        self.registers[GPIO_CLR0] = clear_mask
 
     def get_inputs(self):
-        return tuple(map(gpio.input, self.input_pins))
+        if self.registers is None:
+            return tuple(map(gpio.input, self.input_pins))
+        level = self.registers[GPIO_LEV0]
+        return tuple((level >> pin) & 1 for pin in self.input_pins)
     
     def set_output(self, index, output):
-        gpio.output(self.output_pins[index], output)
+        if self.registers is None:
+            gpio.output(self.output_pins[index], output)
+            return
+        self.registers[GPIO_SET0 if output else GPIO_CLR0] = self.output_masks[index]
 
     def get_input(self, index):
-        return gpio.input(self.input_pins[index])
+        if self.registers is None:
+            return gpio.input(self.input_pins[index])
+        return (self.registers[GPIO_LEV0] >> self.input_pins[index]) & 1
+
+    def inputs_to_mask(self, inputs):
+        # input states packed to the bit positions of their pins in the level register
+        if len(inputs) != len(self.input_pins):
+            raise ValueError(f'expected {len(self.input_pins)} input states, got {len(inputs)}')
+        mask = 0
+        for pin, state in zip(self.input_pins, inputs):
+            if state:
+                mask |= 1 << pin
+        return mask
+
+    def get_inputs_mask(self):
+        if self.registers is None:
+            return self.inputs_to_mask(self.get_inputs())
+        return self.registers[GPIO_LEV0] & self.input_mask
     
 class BlenkyLayer(IOLayer):
-    def __init__(self, address):
+    # 2-bit lanes of every possible byte, and the same with trailing 0b11 lanes cut off
+    _DECODE_LUT = tuple(tuple((byte >> shift) & 0b11 for shift in (0, 2, 4, 6)) for byte in range(256))
+    _DECODE_TAIL_LUT = tuple(lanes[:((~byte & 0xff).bit_length() + 1) // 2] for byte, lanes in enumerate(_DECODE_LUT))
+
+    def __init__(self, address, write_response=None, connection_interval=None):
         super().__init__('BLE')
         self.device = bleak.BleakClient(address)
-        self.ble_input_future = None
+        # None leaves the write type to bleak's default
+        self.write_response = write_response
+        if connection_interval is not None:
+            min_ms, max_ms = connection_interval
+            # the BLE spec allows 7.5ms to 4s, anything else would leave debugfs half written
+            if not 7.5 <= min_ms <= max_ms <= 4000:
+                raise ValueError('connection interval needs 7.5 <= min <= max <= 4000 ms')
+        self.connection_interval = connection_interval
+        # kernel defaults replaced by set_connection_interval, in units of 1.25ms
+        self.previous_connection_interval = None
+        # raw payload of the last notification, the event is set whenever one arrives.
+        # decoding is left to get_input, so notifications nobody waits for cost nothing
+        self.ble_input_data = None
+        self.ble_inputs_event = asyncio.Event()
+        self.input_characteristic = None
+        self.output_characteristic = None
+        self.gpioasm_characteristic = None
         self.logger = logging.getLogger('BLE')
         self.logger.addHandler(logging.StreamHandler())
         self.logger.handlers[0].terminator = '\n'
@@ -91,161 +218,250 @@ class BlenkyLayer(IOLayer):
     async def init(self):
         await self.connect()
 
+        # resolve the characteristics once instead of by UUID on every access
+        self.input_characteristic = self.device.services.get_characteristic(DIGITAL_INPUT_UUID)
+        self.output_characteristic = self.device.services.get_characteristic(DIGITAL_OUTPUT_UUID)
+        self.gpioasm_characteristic = self.device.services.get_characteristic(GPIOASM_UUID)
+        if self.write_response is False and 'write-without-response' not in self.output_characteristic.properties:
+            self.logger.warning('output characteristic does not support write without response, falling back')
+            self.write_response = None
+
         def ble_input_handler(characteristic, data):
-            inputs = self._decode_inputs(data)
-            if self.ble_input_future is None:
-                return
-            if self.ble_input_future.done():
-                return
-            self.ble_input_future.set_result(inputs)
+            self.ble_input_data = data
+            self.ble_inputs_event.set()
 
-        await self.device.start_notify('00002a56-0000-1000-8000-00805f9b34fb', ble_input_handler)
+        await self.device.start_notify(self.input_characteristic, ble_input_handler)
 
 
     async def uninit(self):
         await self.device.disconnect()
+        self.restore_connection_interval()
+
+    def _read_connection_interval(self, bound):
+        with open(CONN_INTERVAL_PATH.format(bound=bound)) as file:
+            return int(file.read())
+
+    def _write_connection_interval(self, min_interval, max_interval):
+        # the kernel rejects a minimum above the current maximum and vice versa
+        bounds = (('min', min_interval), ('max', max_interval))
+        if min_interval > self._read_connection_interval('max'):
+            bounds = bounds[::-1]
+        for bound, interval in bounds:
+            with open(CONN_INTERVAL_PATH.format(bound=bound), 'w') as file:
+                file.write(str(interval))
+
+    def set_connection_interval(self, min_ms, max_ms):
+        # BlueZ has no API for the connection parameters, so the kernel defaults
+        # for new connections are changed instead. Needs root and a mounted debugfs,
+        # and the uC may still negotiate a different interval.
+        # the defaults apply to every connection on the adapter, so they are restored on exit
+        if not 7.5 <= min_ms <= max_ms <= 4000:
+            raise ValueError('connection interval needs 7.5 <= min <= max <= 4000 ms')
+        try:
+            previous = (self._read_connection_interval('min'), self._read_connection_interval('max'))
+            self._write_connection_interval(round(min_ms / 1.25), round(max_ms / 1.25))
+        except OSError as e:
+            self.logger.warning('could not set connection interval: %s', e)
+            return
+        if self.previous_connection_interval is None:
+            self.previous_connection_interval = previous
+            atexit.register(self.restore_connection_interval)
+
+    def restore_connection_interval(self):
+        if self.previous_connection_interval is None:
+            return
+        try:
+            self._write_connection_interval(*self.previous_connection_interval)
+        except OSError as e:
+            self.logger.warning('could not restore connection interval: %s', e)
+        self.previous_connection_interval = None
 
     async def connect(self):
+        if self.connection_interval is not None:
+            self.set_connection_interval(*self.connection_interval)
         self.logger.info('connecting...')
         await self.device.connect()
         print_color_str('OK')
 
     def _encode_outputs(self, outputs):
-        data = [0xff] * math.ceil(len(outputs) / 4)
-        for i in range(len(outputs)):
-            output = outputs[i]
-            byte_index = int(i / 4)
-            bit_index = int(i * 2) % 8
-            data[byte_index] &= ~((~output & 0b11) << bit_index)
-        return bytes(data)
+        # start with the 0b11 (leave unchanged) padding lanes of the last byte,
+        # then shift in the outputs from the highest lane down
+        value = (1 << ((-len(outputs) & 3) << 1)) - 1
+        for output in reversed(outputs):
+            value = (value << 2) | (output & 0b11)
+        return value.to_bytes((len(outputs) + 3) >> 2, 'little')
+
+    def _encode_output(self, index, output):
+        # every lane up to index is 0b11 (leave unchanged), only the lane at index is cleared to output
+        size = (index >> 2) + 1
+        value = ((1 << (size << 3)) - 1) ^ ((~output & 0b11) << (index << 1))
+        return value.to_bytes(size, 'little')
     
     def _decode_inputs(self, input_data):
+        # trailing 0xff bytes are padding only, the last remaining byte may
+        # still end in 0b11 padding lanes
+        data = input_data.rstrip(b'\xff')
+        if not data:
+            return ()
         inputs = []
-        for byte in input_data:
-            for i in range(0, 8, 2):
-                inputs.append((byte >> i) & 0b11)
-        while len(inputs) > 0 and inputs[-1] == 0b11:
-            inputs.pop(-1)
+        for byte in data[:-1]:
+            inputs.extend(self._DECODE_LUT[byte])
+        inputs.extend(self._DECODE_TAIL_LUT[data[-1]])
         return tuple(inputs)
     
+    async def _write_outputs(self, data):
+        if self.write_response is None:
+            await self.device.write_gatt_char(self.output_characteristic, data)
+        else:
+            await self.device.write_gatt_char(self.output_characteristic, data, response=self.write_response)
+
     async def set_outputs(self, outputs):
-        await self.device.write_gatt_char('00002a57-0000-1000-8000-00805f9b34fb', self._encode_outputs(outputs))
+        await self._write_outputs(self._encode_outputs(outputs))
 
-    async def before_get_input(self, index):
-        self.ble_input_future = asyncio.Future()
+    def before_get_input(self, index):
+        self.ble_inputs_event.clear()
 
     async def get_inputs(self):
-        data = await self.device.read_gatt_char('00002a56-0000-1000-8000-00805f9b34fb')
+        data = await self.device.read_gatt_char(self.input_characteristic)
 
         read = self._decode_inputs(data)
         return read
     
     async def set_output(self, index, output):
-        outputs = [0b11] * index + [output]
-        await self.device.write_gatt_char('00002a57-0000-1000-8000-00805f9b34fb', self._encode_outputs(outputs))
+        await self._write_outputs(self._encode_output(index, output))
 
     async def get_input(self, index):
+        # a plain call_later deadline that cancels the current task, no wrapping task like wait_for
+        task = asyncio.current_task()
+        timed_out = False
+
+        def timeout():
+            nonlocal timed_out
+            # once the event is set the task is only waiting to resume, don't cancel it anymore
+            if self.ble_inputs_event.is_set():
+                return
+            timed_out = True
+            task.cancel()
+
+        handle = asyncio.get_running_loop().call_later(5, timeout)
         try:
-            reported = await asyncio.wait_for(self.ble_input_future, 5)
-            try:
-                return reported[index]
-            except IndexError:
-                return None
-        except asyncio.exceptions.TimeoutError:
+            await self.ble_inputs_event.wait()
+        except asyncio.CancelledError:
+            if not timed_out:
+                raise
+            if hasattr(task, 'uncancel'):
+                task.uncancel()
             self.logger.error('Error waiting for input notification')
             return None
+        finally:
+            handle.cancel()
+
+        reported = self._decode_inputs(self.ble_input_data)
+        try:
+            return reported[index]
+        except IndexError:
+            return None
+
+    async def upload_gpioasm(self, payload):
+        # 19 byte chunks prefixed by their index, the top bit is set while more chunks follow
+        chunks = [
+            bytes([(0b10000000 if offset + 19 < len(payload) else 0) | index]) + bytes(payload[offset:offset + 19])
+            for index, offset in enumerate(range(0, max(len(payload), 1), 19))
+        ]
+        # the chunks are queued in order, so there is no need to wait for an acknowledgement each
+        response = 'write-without-response' not in self.gpioasm_characteristic.properties
+        for chunk in chunks:
+            await self.device.write_gatt_char(self.gpioasm_characteristic, chunk, response=response)
 
 class Tester():
-    async def call_func(self, func, *args, **kwargs):
-        if inspect.iscoroutinefunction(func):
-            return await func(*args, **kwargs)
-        return func(*args, **kwargs)
+    class BoundLayer():
+        # wraps the sync methods of a layer once, so tests can await every method
+        # without checking for a coroutine function on every call.
+        # before_get_input only arms the layer and is always called synchronously
+        def __init__(self, layer):
+            self.name = layer.name
+            self.before_get_input = layer.before_get_input
+            for method in ('init', 'uninit', 'set_outputs', 'get_inputs', 'set_output', 'get_input'):
+                setattr(self, method, self.bind(getattr(layer, method)))
+
+        @staticmethod
+        def bind(func):
+            if inspect.iscoroutinefunction(func):
+                return func
+            async def wrapper(*args, **kwargs):
+                return func(*args, **kwargs)
+            return wrapper
     
     def __init__(self, *layers) -> None:
         if(len(layers) != 2):
             raise NotImplementedError('Only 2 layers supported')
-        self.layers = layers
+        self.layers = tuple(map(self.BoundLayer, layers))
         self.logger = logging.getLogger('Tests')
 
     async def init(self):
         for layer in self.layers:
-            await self.call_func(layer.init)
+            await layer.init()
 
     class TestFailedError(RuntimeError):
         pass
 
     async def run(self):
-        signals_list = (
-            (0,0,0,0),
-            (1,0,0,0),
-            (0,1,0,0),
-            (0,0,1,0),
-            (0,0,0,1),
-            (1,1,0,0),
-            (0,0,1,1),
-            (1,0,1,0),
-            (0,1,0,1),
-            (1,1,1,1),
-            (0,0,0,0),
-        )
+        # every test drives the same wires, so they are collected up front
+        # but still have to run one after another
+        tests = []
+        for layers in (self.layers, self.layers[::-1]):
+            for signals in SIGNALS_LIST:
+                tests.append((
+                    ('testing signals %s, %s -> %s...', signals, layers[0].name, layers[1].name),
+                    self.test_signals, layers, signals
+                ))
+        for layers in (self.layers, self.layers[::-1]):
+            for signal in (1, 0):
+                for index in range(4):
+                    tests.append((
+                        ('testing signal index %d: %d, %s -> %s...', index, signal, layers[0].name, layers[1].name),
+                        self.test_signal, layers, index, signal
+                    ))
+
         test_count = [0,0]
         try:
-            for layers in (self.layers, self.layers[::-1]):
-                for signals in signals_list:
-                    try:
-                        self.logger.info(f'testing signals {signals}, {layers[0].name} -> {layers[1].name}...')
-                        await self.test_signals(layers, signals)
-                        print_color_str('OK')
-                        test_count[0] += 1
-                    except self.TestFailedError as e:
-                        print()
-                        print_color('red')
-                        self.logger.error(str(e))
-                        print_color()
-                        print()
-                        test_count[1] += 1
-            # for layer in self.layers:
-            #     await self.call_func(layer.set_outputs, (0, 0, 0, 0))
-
-            for layers in (self.layers, self.layers[::-1]):
-                for signal in (1, 0):
-                    for index in range(4):
-                        try:
-                            self.logger.info(f'testing signal index {index}: {signal}, {layers[0].name} -> {layers[1].name}...')
-                            await self.test_signal(layers, index, signal)
-                            print_color_str('OK')
-                            test_count[0] += 1
-                        except self.TestFailedError as e:
-                            print()
-                            print_color('red')
-                            self.logger.error(str(e))
-                            print_color()
-                            print()
-                            test_count[1] += 1
+            for description, test, *args in tests:
+                try:
+                    self.logger.info(*description)
+                    await test(*args)
+                    print_color_str('OK')
+                    test_count[0] += 1
+                except self.TestFailedError as e:
+                    print()
+                    print_color('red')
+                    self.logger.error(str(e))
+                    print_color()
+                    print()
+                    test_count[1] += 1
         finally:
             pass
             # for layer in self.layers:
-            #     await self.call_func(layer.uninit)
+            #     await layer.uninit()
         if test_count[1] == 0:
             print_color('green')
         else:
             print_color('red')
-        self.logger.info(f'Tests successful: %d, failed: %d', *test_count)
+        self.logger.info('Tests successful: %d, failed: %d', *test_count)
         if test_count[1] > 0:
             sys.exit(1)
         print_color()
         print()
 
     async def test_signals(self, layers, signals: tuple[int]):
-        await self.call_func(layers[0].set_outputs, signals)
-        reported = await self.call_func(layers[1].get_inputs)
+        await layers[0].set_outputs(signals)
+        reported = await layers[1].get_inputs()
         if signals != reported:
             raise self.TestFailedError(f'signal {layers[0].name}{signals} did not match {layers[1].name}{reported}')
 
     async def test_signal(self, layers, index, signal):
-        await self.call_func(layers[1].before_get_input, index)
-        await self.call_func(layers[0].set_output, index, signal)
-        reported = await self.call_func(layers[1].get_input, index)
+        layers[1].before_get_input(index)
+        await layers[0].set_output(index, signal)
+        reported = await layers[1].get_input(index)
         if signal != reported:
             raise self.TestFailedError(f'signal {layers[0].name}: {signal} did not match {layers[1].name}: {reported}')
 
@@ -254,12 +470,19 @@ async def main():
     parser.add_argument('--address', '-a', type=str, required=True, help='BLE MAC address / Address UUID to connect to')
     parser.add_argument('--input-pin', '-i', type=int, required=True, help='One or multiple input pins on the PI connected to the uC', nargs='+')
     parser.add_argument('--output-pin', '-o', type=int, required=True, help='One or multiple output pins on the PI connected to the uC', nargs='+')
+    parser.add_argument('--write-without-response', action='store_true', help='Write BLE outputs without waiting for an acknowledgement. Faster, but the uC may not have applied them yet when the PI reads its inputs')
+    parser.add_argument('--connection-interval', type=float, nargs=2, metavar=('MIN_MS', 'MAX_MS'), help='Request a BLE connection interval range, e.g. 7.5 15. Linux only, needs root and debugfs')
     args = parser.parse_args()
+    if args.connection_interval is not None:
+        min_ms, max_ms = args.connection_interval
+        # the BLE spec allows 7.5ms to 4s, anything else would leave debugfs half written
+        if not 7.5 <= min_ms <= max_ms <= 4000:
+            parser.error('--connection-interval needs 7.5 <= MIN_MS <= MAX_MS <= 4000')
 
     atexit.register(gpio.cleanup)
 
     gpioLayer = RPIGPIOLayer(args.input_pin, args.output_pin)
-    bleLayer = BlenkyLayer(args.address)
+    bleLayer = BlenkyLayer(args.address, write_response=False if args.write_without_response else None, connection_interval=args.connection_interval)
 
     tester = Tester(gpioLayer, bleLayer)
     await tester.init()
@@ -268,14 +491,27 @@ async def main():
     async def test_inputs_delayed(target_states, timeout_min_ms, timeout_max_ms):
         timeout_min = timeout_min_ms / 1000
         timeout_max = timeout_max_ms / 1000
-        time_start = time.time()
+        time_start = time.monotonic()
         time_delta = 0
+        target_mask = gpioLayer.inputs_to_mask(target_states)
+        backoff = 0.0005
 
-        while gpioLayer.get_inputs() != target_states:
-            time_delta = time.time() - time_start
+        while gpioLayer.get_inputs_mask() != target_mask:
+            time_delta = time.monotonic() - time_start
             if time_delta > timeout_max:
                 raise TimeoutError(f'runtime slept for too long ({int(time_delta * 1000)} > {timeout_max_ms}) inputs: {gpioLayer.get_inputs()}')
-            time.sleep(0.0005)
+            # matching before timeout_min fails anyway, so until shortly before it
+            # back off and let the event loop run. Within the accepted window the
+            # loop timers are too coarse, so poll finely there
+            early = (timeout_min - time_delta) / 2
+            if early > 0.002:
+                await asyncio.sleep(min(backoff, early))
+                backoff *= 1.5
+            else:
+                time.sleep(0.0005)
+        # other callbacks may have run during the last sleep, so the delta measured
+        # before it can be stale by more than the poll interval
+        time_delta = time.monotonic() - time_start
         if time_delta < timeout_min:
             raise TimeoutError(f'runtime slept for too short ({int(time_delta * 1000)} < {timeout_min_ms}) inputs: {gpioLayer.get_inputs()}')
         return int(time_delta * 1000)
@@ -291,12 +527,7 @@ async def main():
     
     logger.info('uploading gpioASM code...')
 
-    index = 0
-    while len(payload) > 19:
-        await bleLayer.device.write_gatt_char('b1190001-2a74-d5a2-784f-c1cdb3862ab0', [(0b10000000 | index)] + payload[:19])
-        index += 1
-        payload = payload[19:]
-    await bleLayer.device.write_gatt_char('b1190001-2a74-d5a2-784f-c1cdb3862ab0', [index] + payload)
+    await bleLayer.upload_gpioasm(payload)
     print_color_str('OK')
 
     logger.info('synchronizing...')
@@ -308,20 +539,8 @@ async def main():
 
     # the following steps are refrelected in the file test.gpioasm
 
-    targets = [
-        ((1, 0, 0, 0), 100),
-        ((0, 1, 0, 0), 100),
-        ((0, 0, 1, 0), 100),
-        ((0, 0, 0, 1), 100)
-    ]
-
-    for timeout in (100, 200):
-        for _ in range(10):
-            targets.append(((1, 0, 1, 0), timeout))
-            targets.append(((0, 1, 0, 1), timeout))
-
-    for (states, timeout) in targets:
-        logger.info(f'awaiting {states}...')
+    for (states, timeout) in GPIOASM_TARGETS:
+        logger.info('awaiting %s...', states)
         time_taken = await test_inputs_delayed(states, timeout - 10, timeout + 3)
         print_color_str(f'OK, took {time_taken}ms')
 
@@ -342,4 +561,16 @@ async def main():
     print()
 
 if __name__ == '__main__':
-    asyncio.run(main())
+    # prefer libuv's event loop for cheaper callback dispatch, if installed
+    try:
+        import uvloop
+    except ImportError:
+        uvloop = None
+    if uvloop is None:
+        asyncio.run(main())
+    elif hasattr(uvloop, 'run'):
+        uvloop.run(main())
+    else:
+        # uvloop before 0.18 has no run()
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+        asyncio.run(main())